@@ -1,6 +1,23 @@
 from langchain.chat_models import init_chat_model
 import os
 
+from helpers.deadline import LLM_MAX_RETRIES, LLM_REQUEST_TIMEOUT_S
+from helpers.model_router import ModelRouter
 
-model = init_chat_model("gemini-2.0-flash", model_provider="google_genai",
- api_key=os.getenv("GOOGLE_API_KEY"))
\ No newline at end of file
+
+def build_model(model_name: str):
+    return init_chat_model(model_name, model_provider="google_genai",
+     api_key=os.getenv("GOOGLE_API_KEY"),
+     timeout=LLM_REQUEST_TIMEOUT_S,
+     max_retries=LLM_MAX_RETRIES)
+
+
+# Model per tier; set a tier's variable to "none" to disable it
+MODEL_TIER_NAMES = {
+    "light": os.getenv("LLM_LIGHT_MODEL", "gemini-2.0-flash-lite"),
+    "standard": os.getenv("LLM_STANDARD_MODEL", "gemini-2.0-flash"),
+    "strong": os.getenv("LLM_STRONG_MODEL", "gemini-2.5-flash"),
+}
+
+models = {tier: build_model(name) for tier, name in MODEL_TIER_NAMES.items() if name != "none"}
+model_router = ModelRouter(models)
@@ -0,0 +1,150 @@
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+# Results with more rows than this are kept in a local frame instead of being sent to the LLM
+ANALYTICS_ROW_THRESHOLD = int(os.getenv("ANALYTICS_ROW_THRESHOLD", "50"))
+ANALYTICS_MAX_DATASETS = int(os.getenv("ANALYTICS_MAX_DATASETS", "32"))
+ANALYTICS_MAX_OUTPUT_ROWS = int(os.getenv("ANALYTICS_MAX_OUTPUT_ROWS", "20"))
+
+_datasets: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+_datasets_lock = threading.Lock()
+_dataset_ids = itertools.count(1)
+
+_AGGREGATIONS = {"sum", "mean", "count", "min", "max", "median"}
+_PERIODS = {"day": "D", "week": "W", "month": "M"}
+
+
+def to_frame(documents: List[dict]) -> pd.DataFrame:
+    """Flattens Mongo documents (nested fields become dotted columns) into a DataFrame."""
+    frame = pd.json_normalize(documents)
+    if "_id" in frame.columns:
+        frame["_id"] = frame["_id"].astype(str)
+    return frame
+
+
+def register_dataset(documents: List[dict], notes: Optional[List[str]] = None) -> str:
+    frame = to_frame(documents)
+    # Notes (e.g. truncation) travel with the frame so analyses over partial data say so
+    frame.attrs["notes"] = list(notes or [])
+    dataset_id = f"ds_{next(_dataset_ids)}"
+    with _datasets_lock:
+        _datasets[dataset_id] = frame
+        while len(_datasets) > ANALYTICS_MAX_DATASETS:
+            _datasets.popitem(last=False)
+    return dataset_id
+
+
+def get_dataset(dataset_id: str) -> pd.DataFrame:
+    with _datasets_lock:
+        if dataset_id not in _datasets:
+            raise KeyError(f"Unknown or expired dataset '{dataset_id}'. Re-run the query to load it again.")
+        _datasets.move_to_end(dataset_id)
+        return _datasets[dataset_id]
+
+
+def dataset_notes(dataset_id: str) -> List[str]:
+    return get_dataset(dataset_id).attrs.get("notes", [])
+
+
+def summarize_dataset(dataset_id: str) -> Dict[str, Any]:
+    frame = get_dataset(dataset_id)
+    summary = {
+        "dataset": dataset_id,
+        "row_count": len(frame),
+        "columns": list(frame.columns),
+        "sample_rows": _records(frame.head(3)),
+        "note": "Result too large to return in full. Use the analyze_dataset tool on this dataset for totals, averages, rankings or period comparisons."
+    }
+    if frame.attrs.get("notes"):
+        summary["notes"] = frame.attrs["notes"]
+    return summary
+
+
+def maybe_register_results(result: Any) -> Any:
+    """
+    Swaps large query results for a dataset summary; small results and error messages pass through unchanged.
+    Notes attached to the result (narrowing, truncation) are kept next to the rows or in the summary.
+    """
+    notes = getattr(result, "notes", [])
+    if isinstance(result, list) and ANALYTICS_ROW_THRESHOLD > 0 and len(result) > ANALYTICS_ROW_THRESHOLD:
+        return summarize_dataset(register_dataset(result, notes))
+    if notes:
+        return {"notes": notes, "results": list(result)}
+    return result
+
+
+def _records(frame: pd.DataFrame) -> List[dict]:
+    return json.loads(frame.to_json(orient="records", date_format="iso", default_handler=str))
+
+
+def _require_columns(frame: pd.DataFrame, *columns: str) -> None:
+    missing = [column for column in columns if column not in frame.columns]
+    if missing:
+        raise KeyError(f"Unknown column(s) {missing}. Available columns: {list(frame.columns)}")
+
+
+def run_analysis(spec: Dict[str, Any]) -> Any:
+    """
+    Runs one analytics operation over a registered dataset. Supported operations:
+      - aggregate: {"operation": "aggregate", "column": "priceSold", "agg": "sum", "by": optional column or list}
+      - top_n: {"operation": "top_n", "column": "quantitySold", "n": 5, "ascending": false}
+      - period_over_period: {"operation": "period_over_period", "date_column": "created_at", "column": "amount",
+                             "period": "day" | "week" | "month", "agg": "sum"}
+      - describe: {"operation": "describe"}
+    """
+    frame = get_dataset(spec["dataset"])
+    operation = spec.get("operation", "describe")
+    limit = int(spec.get("n", ANALYTICS_MAX_OUTPUT_ROWS))
+
+    if operation == "describe":
+        _require_columns(frame, *spec.get("columns", []))
+        selected = frame[spec["columns"]] if spec.get("columns") else frame
+        return json.loads(selected.describe(include="all").to_json(default_handler=str))
+
+    if operation == "aggregate":
+        agg = spec.get("agg", "sum")
+        if agg not in _AGGREGATIONS:
+            raise ValueError(f"Unsupported agg '{agg}'. Use one of {sorted(_AGGREGATIONS)}")
+        column = spec["column"]
+        by = spec.get("by")
+        by_columns = [by] if isinstance(by, str) else (by or [])
+        _require_columns(frame, column, *by_columns)
+        if not by_columns:
+            return {"column": column, "agg": agg, "value": _scalar(frame[column].agg(agg))}
+        grouped = frame.groupby(by_columns)[column].agg(agg).sort_values(ascending=bool(spec.get("ascending", False)))
+        return _records(grouped.head(limit).reset_index())
+
+    if operation == "top_n":
+        column = spec["column"]
+        _require_columns(frame, column)
+        ranked = frame.sort_values(column, ascending=bool(spec.get("ascending", False))).head(limit)
+        if spec.get("columns"):
+            _require_columns(frame, *spec["columns"])
+            ranked = ranked[spec["columns"]]
+        return _records(ranked)
+
+    if operation == "period_over_period":
+        agg = spec.get("agg", "sum")
+        period = spec.get("period", "month")
+        if agg not in _AGGREGATIONS or period not in _PERIODS:
+            raise ValueError(f"agg must be one of {sorted(_AGGREGATIONS)} and period one of {sorted(_PERIODS)}")
+        date_column, column = spec.get("date_column", "created_at"), spec["column"]
+        _require_columns(frame, date_column, column)
+        dates = pd.to_datetime(frame[date_column], errors="coerce", utc=True)
+        series = frame[column].groupby(dates.dt.tz_localize(None).dt.to_period(_PERIODS[period])).agg(agg).sort_index()
+        result = pd.DataFrame({"period": series.index.astype(str), column: series.values,
+                               "change_pct": (series.pct_change() * 100).round(2).values})
+        return _records(result.tail(limit))
+
+    raise ValueError(f"Unsupported operation: {operation}")
+
+
+def _scalar(value: Any) -> Any:
+    return value.item() if hasattr(value, "item") else value
@@ -0,0 +1,145 @@
+import asyncio
+import datetime
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "true").lower() == "true"
+# Seconds to wait after a window rolls over before warming, so the new window's data has started to land
+CACHE_WARMER_DELAY_S = int(os.getenv("CACHE_WARMER_DELAY_S", "60"))
+CACHE_WARMER_TOP_N = int(os.getenv("CACHE_WARMER_TOP_N", "20"))
+CACHE_WARMER_CONCURRENCY = int(os.getenv("CACHE_WARMER_CONCURRENCY", "3"))
+HOT_QUERY_MAX_SHAPES = int(os.getenv("HOT_QUERY_MAX_SHAPES", "500"))
+RESULT_CACHE_TTL_S = int(os.getenv("RESULT_CACHE_TTL_S", "21600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+
+DAILY_PLACEHOLDERS = {"{{today_start}}", "{{yesterday_start}}", "{{last_7_days_start}}", "{{now}}"}
+MONTHLY_PLACEHOLDERS = {"{{last_month_start}}", "{{last_month_end}}"}
+
+
+def query_placeholders(node: Any) -> Set[str]:
+    if isinstance(node, dict):
+        return set().union(*(query_placeholders(value) for value in node.values())) if node else set()
+    if isinstance(node, list):
+        return set().union(*(query_placeholders(item) for item in node)) if node else set()
+    if isinstance(node, str) and node.startswith("{{") and node.endswith("}}"):
+        return {node}
+    return set()
+
+
+def _has_closed_window(node: Any) -> bool:
+    """True if every date range built from placeholders has an upper bound that is not {{now}}."""
+    ranges = []
+
+    def collect(value: Any) -> None:
+        if isinstance(value, dict):
+            bounds = {op: value[op] for op in ("$gte", "$gt", "$lt", "$lte") if isinstance(value.get(op), str) and value[op].startswith("{{")}
+            if bounds:
+                ranges.append(bounds)
+            for child in value.values():
+                collect(child)
+        elif isinstance(value, list):
+            for child in value:
+                collect(child)
+
+    collect(node)
+    return bool(ranges) and all(
+        any(op in bounds and bounds[op] != "{{now}}" for op in ("$lt", "$lte")) for bounds in ranges
+    )
+
+
+# --- Hot query shapes (queries with their placeholders unresolved) ---
+_hot_queries: Dict[str, Tuple[int, dict]] = {}
+_hot_queries_lock = threading.Lock()
+
+
+def record_hot_query(parsed_query: dict) -> None:
+    shape = json.dumps(parsed_query, sort_keys=True)
+    with _hot_queries_lock:
+        count, _ = _hot_queries.get(shape, (0, parsed_query))
+        _hot_queries[shape] = (count + 1, parsed_query)
+        if len(_hot_queries) > HOT_QUERY_MAX_SHAPES:
+            coldest = min(_hot_queries, key=lambda key: _hot_queries[key][0])
+            del _hot_queries[coldest]
+
+
+def hot_queries(placeholders: Set[str], limit: int = CACHE_WARMER_TOP_N) -> List[dict]:
+    """
+    Most frequent query shapes that use at least one of `placeholders`. Only closed-window shapes are
+    returned, since results running up to {{now}} are never cached and warming them would be wasted work.
+    """
+    with _hot_queries_lock:
+        ranked = sorted(_hot_queries.values(), key=lambda entry: entry[0], reverse=True)
+    return [query for _, query in ranked if query_placeholders(query) & placeholders and _has_closed_window(query)][:limit]
+
+
+# --- Results of closed date windows, keyed by the resolved query ---
+class ResultCache:
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl_s: int = RESULT_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, list]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(parsed_query: dict, final_query: dict) -> Optional[str]:
+        """Only closed windows (e.g. yesterday, last month) are cacheable; anything up to {{now}} keeps changing."""
+        if not _has_closed_window(parsed_query):
+            return None
+        return json.dumps(final_query, sort_keys=True, default=str)
+
+    def get(self, key: str) -> Optional[list]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_s:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, result: list) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+result_cache = ResultCache()
+
+
+# --- Warmer ---
+def next_rollover(now: datetime.datetime) -> datetime.datetime:
+    """Next UTC midnight; the placeholder windows all roll over at midnight (monthly ones on the 1st)."""
+    return (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def warm_hot_queries(execute: Callable[[dict], Any], placeholders: Set[str]) -> int:
+    """Re-runs the hot queries for the rolled-over windows with bounded concurrency. No LLM calls are made."""
+    semaphore = asyncio.Semaphore(CACHE_WARMER_CONCURRENCY)
+
+    async def warm(parsed_query: dict) -> None:
+        async with semaphore:
+            # execute resolves the placeholders for the new window and fills the result cache
+            await asyncio.to_thread(execute, parsed_query)
+
+    queries = hot_queries(placeholders)
+    await asyncio.gather(*(warm(query) for query in queries), return_exceptions=True)
+    return len(queries)
+
+
+async def run_cache_warmer(execute: Callable[[dict], Any]) -> None:
+    while True:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        rollover = next_rollover(now)
+        await asyncio.sleep((rollover - now).total_seconds() + CACHE_WARMER_DELAY_S)
+
+        placeholders = DAILY_PLACEHOLDERS | (MONTHLY_PLACEHOLDERS if rollover.day == 1 else set())
+        try:
+            warmed = await warm_hot_queries(execute, placeholders)
+            print(f"Cache warmer: re-ran {warmed} hot queries after the {rollover.isoformat()} rollover")
+        except Exception as e:
+            print(f"Cache warmer failed: {e}")
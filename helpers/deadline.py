@@ -0,0 +1,162 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+
+# --- Per-request deadline and per-stage budgets (seconds) ---
+REQUEST_TIMEOUT_S = float(os.getenv("ASK_REQUEST_TIMEOUT_S", "60"))
+STAGE_BUDGETS_S = {
+    "agent": float(os.getenv("AGENT_STAGE_TIMEOUT_S", "55")),
+    "generation": float(os.getenv("LLM_GENERATION_TIMEOUT_S", "20")),
+    "db": float(os.getenv("MONGO_QUERY_TIMEOUT_S", "15")),
+}
+
+# --- Hedged LLM requests ---
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Threads for hedged calls; a call that times out keeps its thread until the client-side timeout ends it
+LLM_HEDGE_MAX_WORKERS = int(os.getenv("LLM_HEDGE_MAX_WORKERS", "8"))
+
+# --- LLM client limits, sized so every attempt fits inside the generation budget ---
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+LLM_REQUEST_TIMEOUT_S = float(os.getenv("LLM_REQUEST_TIMEOUT_S", str(STAGE_BUDGETS_S["generation"] / (LLM_MAX_RETRIES + 1))))
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# Timeout exceptions raised by LLM clients and their transports (google.api_core, httpx, requests, urllib3),
+# matched by name so none of those packages has to be imported here
+_CLIENT_TIMEOUT_ERROR_NAMES = {"DeadlineExceeded", "TimeoutException", "Timeout", "ReadTimeout", "ConnectTimeout",
+                               "ReadTimeoutError", "ConnectTimeoutError", "APITimeoutError"}
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """True for TimeoutError or a client/transport timeout, including one wrapped as the cause of another error."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, TimeoutError) or any(cls.__name__ in _CLIENT_TIMEOUT_ERROR_NAMES for cls in type(error).__mro__):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class Deadline:
+    def __init__(self, timeout_s: float):
+        self.timeout_s = timeout_s
+        self.expires_at = time.monotonic() + timeout_s
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget(self, stage: str) -> float:
+        """Returns the time left for `stage`: its configured budget, capped by what is left of the request."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.timeout_s}s exceeded before stage '{stage}'")
+        return min(STAGE_BUDGETS_S.get(stage, remaining), remaining)
+
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("current_deadline", default=None)
+
+
+def start_deadline(timeout_s: Optional[float] = None) -> contextvars.Token:
+    """Starts a deadline for the current request. Threads started via asyncio.to_thread inherit it."""
+    return _current_deadline.set(Deadline(timeout_s if timeout_s is not None else REQUEST_TIMEOUT_S))
+
+
+def reset_deadline(token: contextvars.Token) -> None:
+    _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def stage_budget(stage: str) -> float:
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return STAGE_BUDGETS_S[stage]
+    return deadline.budget(stage)
+
+
+# --- Latency tracking for hedging ---
+class LatencyTracker:
+    def __init__(self, maxlen: int = 200):
+        self._samples = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+generation_latency = LatencyTracker()
+_hedge_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge") if LLM_HEDGE_ENABLED else None
+
+
+def hedged_call(fn: Callable[[], Any], timeout: float, tracker: LatencyTracker = generation_latency) -> Any:
+    """
+    Runs `fn` with a hard timeout. When hedging is enabled and the first call is slower than the
+    tracked p95, a duplicate call is fired and whichever response arrives first wins. When it is
+    disabled, `fn` runs on the caller's thread and the client timeout (LLM_REQUEST_TIMEOUT_S) bounds it.
+    """
+    start = time.monotonic()
+    if _hedge_executor is None:
+        try:
+            result = fn()
+        except Exception as e:
+            # The client timeout is what enforces the budget here; report it the same way as a hard timeout
+            if is_timeout_error(e) and not isinstance(e, DeadlineExceeded):
+                raise DeadlineExceeded(f"LLM call did not finish within its client timeout: {e}") from e
+            raise
+        tracker.record(time.monotonic() - start)
+        return result
+
+    expires_at = start + timeout
+    pending = {_hedge_executor.submit(contextvars.copy_context().run, fn)}
+
+    hedge_after = tracker.p95()
+    if hedge_after is not None and hedge_after < timeout:
+        done, _ = wait(pending, timeout=hedge_after)
+        if not done:
+            print(f"Hedging LLM request after {hedge_after:.2f}s (p95)")
+            pending.add(_hedge_executor.submit(contextvars.copy_context().run, fn))
+
+    error = None
+    while pending:
+        left = expires_at - time.monotonic()
+        if left <= 0:
+            break
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                tracker.record(time.monotonic() - start)
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+
+    for future in pending:
+        future.cancel()
+    if error is not None and not pending:
+        if is_timeout_error(error) and not isinstance(error, DeadlineExceeded):
+            raise DeadlineExceeded(f"LLM call did not finish within its client timeout: {error}") from error
+        raise error
+    raise DeadlineExceeded(f"LLM call did not finish within {timeout:.1f}s")
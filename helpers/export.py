@@ -0,0 +1,169 @@
+import csv
+import datetime
+import io
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_MAX_TIME_MS = int(os.getenv("EXPORT_MAX_TIME_MS", "120000"))
+
+# Trailing column holding, as JSON, fields that have no column of their own (or whose value does not fit its column)
+EXPORT_EXTRA_COLUMN = "_extra"
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _flat_value(value: Any) -> Any:
+    """Makes a Mongo value fit a flat row: nested documents become JSON, ObjectIds and other BSON types become strings."""
+    if value is None or isinstance(value, (str, int, float, bool, datetime.datetime)):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def _batches(cursor: Iterable[dict], batch_size: int) -> Iterator[List[dict]]:
+    batch = []
+    with cursor:
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def stream_ndjson(cursor: Iterable[dict], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    for batch in _batches(cursor, batch_size):
+        yield "".join(json.dumps(document, default=str) + "\n" for document in batch).encode("utf-8")
+
+
+def _extra_json(extra: Dict[str, Any]) -> Any:
+    return json.dumps(extra, default=str) if extra else None
+
+
+def stream_csv(cursor: Iterable[dict], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    # Columns are taken from the first batch; fields that only appear later go to the trailing extra column
+    writer = None
+    fieldnames: List[str] = []
+    buffer = io.StringIO()
+    for batch in _batches(cursor, batch_size):
+        if writer is None:
+            fieldnames = list(dict.fromkeys(key for document in batch for key in document))
+            writer = csv.DictWriter(buffer, fieldnames=fieldnames + [EXPORT_EXTRA_COLUMN])
+            writer.writeheader()
+        for document in batch:
+            row = {key: _flat_value(document[key]) for key in fieldnames if key in document}
+            row[EXPORT_EXTRA_COLUMN] = _extra_json({key: value for key, value in document.items() if key not in row})
+            writer.writerow(row)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back in chunks while keeping the absolute position Parquet needs."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema(pa, rows: List[Dict[str, Any]]):
+    """
+    Infers the file schema from the first batch, widened so later batches still fit: all-null or mixed
+    columns become strings and integer columns become float64.
+    """
+    fields = []
+    for name in dict.fromkeys(key for row in rows for key in row):
+        try:
+            column_type = pa.array([row.get(name) for row in rows]).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            column_type = pa.string()
+        if pa.types.is_null(column_type):
+            column_type = pa.string()
+        elif pa.types.is_integer(column_type):
+            column_type = pa.float64()
+        fields.append(pa.field(name, column_type))
+    return pa.schema(fields + [pa.field(EXPORT_EXTRA_COLUMN, pa.string())])
+
+
+def _parquet_value(pa, column_type, value: Any) -> Tuple[bool, Any]:
+    """Returns (fits, value) for a flat value in a column of `column_type`; string columns take any value as text."""
+    if value is None:
+        return True, None
+    if pa.types.is_string(column_type):
+        return True, value.isoformat() if isinstance(value, datetime.datetime) else str(value)
+    if pa.types.is_floating(column_type):
+        return isinstance(value, (int, float)) and not isinstance(value, bool), value
+    if pa.types.is_boolean(column_type):
+        return isinstance(value, bool), value
+    if pa.types.is_timestamp(column_type):
+        return isinstance(value, datetime.datetime), value
+    return False, value
+
+
+def _parquet_rows(pa, schema, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aligns rows to the file schema; unknown fields and values that do not fit their column go to the extra column."""
+    aligned = []
+    for row in rows:
+        out, extra = {}, {}
+        for key, value in row.items():
+            index = schema.get_field_index(key) if key != EXPORT_EXTRA_COLUMN else -1
+            fits, coerced = _parquet_value(pa, schema.field(index).type, value) if index >= 0 else (False, value)
+            if fits:
+                out[key] = coerced
+            else:
+                extra[key] = value
+        out[EXPORT_EXTRA_COLUMN] = _extra_json(extra)
+        aligned.append(out)
+    return aligned
+
+
+def stream_parquet(cursor: Iterable[dict], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    # Imported lazily so pyarrow is only loaded when a Parquet export is requested
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    for batch in _batches(cursor, batch_size):
+        rows: List[Dict[str, Any]] = [{key: _flat_value(value) for key, value in document.items()} for document in batch]
+        if writer is None:
+            # One row group per batch; the schema is inferred (and widened) from the first batch
+            writer = pq.ParquetWriter(sink, _parquet_schema(pa, rows))
+        writer.write_table(pa.Table.from_pylist(_parquet_rows(pa, writer.schema, rows), schema=writer.schema))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+EXPORT_STREAMERS = {
+    "csv": stream_csv,
+    "ndjson": stream_ndjson,
+    "parquet": stream_parquet,
+}
@@ -0,0 +1,247 @@
+import contextvars
+import copy
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from prompt.prompt import PRISMA_SCHEMA_FOR_LLM
+
+
+FOLLOWUP_FAST_PATH_ENABLED = os.getenv("FOLLOWUP_FAST_PATH_ENABLED", "true").lower() == "true"
+FOLLOWUP_MAX_WORDS = int(os.getenv("FOLLOWUP_MAX_WORDS", "10"))
+FOLLOWUP_MAX_SESSIONS = int(os.getenv("FOLLOWUP_MAX_SESSIONS", "1000"))
+
+
+# --- Schema lookups, parsed from the prompt schema so they stay in sync with it ---
+def _parse_schema(schema: str) -> Tuple[Dict[str, Dict[str, str]], Dict[str, Dict[str, Tuple[str, str]]]]:
+    """Returns {collection: {lowercase field: field}} and {collection: {lowercase enum value: (field, value)}}."""
+    fields: Dict[str, Dict[str, str]] = {}
+    enums: Dict[str, Dict[str, Tuple[str, str]]] = {}
+    collection = None
+    for line in schema.splitlines():
+        heading = re.match(r"^## \d+\. (\w+)", line)
+        if heading:
+            collection = heading.group(1)
+            fields[collection], enums[collection] = {}, {}
+            continue
+        field = re.match(r"^\s+- `(\w+)` \(([^)]*)\)", line)
+        if collection and field:
+            fields[collection][field.group(1).lower()] = field.group(1)
+            if field.group(2).startswith("Enum:"):
+                for value in re.findall(r'"(\w+)"', field.group(2)):
+                    enums[collection][value.lower()] = (field.group(1), value)
+    return fields, enums
+
+
+SCHEMA_FIELDS, SCHEMA_ENUMS = _parse_schema(PRISMA_SCHEMA_FOR_LLM)
+
+# Date windows a follow-up can switch to, as (start, end) placeholders
+DATE_WINDOWS = [
+    (re.compile(r"\btoday\b"), ("{{today_start}}", "{{now}}")),
+    (re.compile(r"\byesterday\b"), ("{{yesterday_start}}", "{{today_start}}")),
+    (re.compile(r"\b(?:last|past) (?:week|7 days)\b"), ("{{last_7_days_start}}", "{{now}}")),
+    (re.compile(r"\blast month\b"), ("{{last_month_start}}", "{{last_month_end}}")),
+]
+_REFINEMENT_CUE = re.compile(r"^(?:now|only|just|and|but|same|what about|how about|sort|order|show only|top|limit)\b")
+_SORT_PATTERN = re.compile(r"\b(?:sorted|sort|ordered|order|ranked|rank) by (\w+)(?: (ascending|asc|descending|desc|highest|lowest))?\b")
+_LIMIT_PATTERN = re.compile(r"\b(?:top|first|only|just(?: the)?(?: top)?|limit(?: to)?) (\d+)\b")
+_FIELD_ALIASES = {"date": "created_at", "time": "created_at", "created": "created_at", "cost": "amount"}
+# Words allowed around the recognised edits; anything else (a collection, an unmapped date like "this month") means a new question
+_FILLER_WORDS = {
+    "now", "only", "just", "the", "for", "and", "but", "same", "what", "about", "how", "show", "me", "please",
+    "them", "those", "these", "ones", "it", "instead", "then", "from", "in", "of", "to", "give", "list", "again",
+    "with", "by", "payments", "transactions", "records", "results", "rows", "entries",
+}
+
+
+# --- Last executed query per session ---
+_current_session: contextvars.ContextVar = contextvars.ContextVar("current_session", default=None)
+_last_queries: "OrderedDict[str, dict]" = OrderedDict()
+_last_queries_lock = threading.Lock()
+
+
+def set_session(session_id: str) -> contextvars.Token:
+    return _current_session.set(session_id)
+
+
+def reset_session(token: contextvars.Token) -> None:
+    _current_session.reset(token)
+
+
+def remember_query(parsed_query: dict) -> None:
+    """Stores the last executed query (with date placeholders unresolved) for the current session."""
+    session_id = _current_session.get()
+    if session_id is None:
+        return
+    with _last_queries_lock:
+        _last_queries[session_id] = copy.deepcopy(parsed_query)
+        _last_queries.move_to_end(session_id)
+        while len(_last_queries) > FOLLOWUP_MAX_SESSIONS:
+            _last_queries.popitem(last=False)
+
+
+def get_last_query() -> Optional[dict]:
+    session_id = _current_session.get()
+    with _last_queries_lock:
+        last_query = _last_queries.get(session_id)
+        return copy.deepcopy(last_query) if last_query is not None else None
+
+
+# --- Edits ---
+def _resolve_field(collection: str, word: str) -> Optional[str]:
+    known = SCHEMA_FIELDS.get(collection, {})
+    word = _FIELD_ALIASES.get(word, word)
+    if word in known:
+        return known[word]
+    candidates = [field for key, field in known.items() if key.startswith(word)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _swap_date_window(node: Any, window: Tuple[str, str]) -> bool:
+    """Sets every placeholder $gte/$gt .. $lt/$lte range to `window` in place. Returns True if one was found."""
+    swapped = False
+    if isinstance(node, dict):
+        lower = next((op for op in ("$gte", "$gt") if isinstance(node.get(op), str) and node[op].startswith("{{")), None)
+        upper = next((op for op in ("$lt", "$lte") if isinstance(node.get(op), str) and node[op].startswith("{{")), None)
+        if lower or upper:
+            # A one-sided range ("since today") gets the missing bound, so the result covers exactly the new window
+            node[lower or "$gte"] = window[0]
+            node[upper or ("$lte" if window[1] == "{{last_month_end}}" else "$lt")] = window[1]
+            swapped = True
+        for value in node.values():
+            swapped = _swap_date_window(value, window) or swapped
+    elif isinstance(node, list):
+        for item in node:
+            swapped = _swap_date_window(item, window) or swapped
+    return swapped
+
+
+def _set_leading_match(pipeline: List[dict], field: str, value: Any) -> None:
+    """Sets `field` in the pipeline's leading $match (adding one if needed), so a new filter replaces the old one."""
+    if pipeline and "$match" in pipeline[0]:
+        pipeline[0]["$match"][field] = value
+    else:
+        pipeline.insert(0, {"$match": {field: value}})
+
+
+def _set_ranking(pipeline: List[dict], sort: Optional[dict], limit: Optional[int], ranked: bool = False) -> bool:
+    """
+    Applies a sort and/or limit to the end of the pipeline, keeping $sort directly before $limit so the
+    limit takes the top rows. Returns False when the edit cannot be applied without a fresh generation.
+    """
+    tail_sort = len(pipeline) - 1 if pipeline and "$sort" in pipeline[-1] else None
+    tail_limit = None
+    if pipeline and "$limit" in pipeline[-1]:
+        tail_limit = len(pipeline) - 1
+        if len(pipeline) > 1 and "$sort" in pipeline[-2]:
+            tail_sort = len(pipeline) - 2
+    if sort is None and tail_sort is not None:
+        sort = pipeline[tail_sort]["$sort"]
+    if ranked and sort is None:
+        # "top N" with nothing to rank by would return N arbitrary rows
+        return False
+    # A $limit earlier in the pipeline would rank an arbitrary subset, not the whole result
+    if sort is not None and any("$limit" in stage for index, stage in enumerate(pipeline) if index != tail_limit):
+        return False
+    if limit is None and tail_limit is not None:
+        limit = pipeline[tail_limit]["$limit"]
+    for index in sorted({i for i in (tail_sort, tail_limit) if i is not None}, reverse=True):
+        del pipeline[index]
+    if sort is not None:
+        pipeline.append({"$sort": sort})
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    return True
+
+
+def apply_refinement(question: str, previous: dict) -> Optional[dict]:
+    """
+    Applies a short follow-up ("now only for last week", "sort by price", "just the top 5", "only cash")
+    to the previous query. Returns the edited query, or None if the follow-up is not a recognised edit.
+    """
+    text = re.sub(r"\s+", " ", question.lower()).strip(" ?.!")
+    if len(text.split()) > FOLLOWUP_MAX_WORDS or not _REFINEMENT_CUE.search(text):
+        return None
+
+    query = copy.deepcopy(previous)
+    collection = query.get("collection", "")
+    aggregate = query.get("operation") == "aggregate"
+    if aggregate and not isinstance(query.get("pipeline"), list):
+        return None
+    edited = False
+    consumed = []
+
+    for pattern, window in DATE_WINDOWS:
+        match = pattern.search(text)
+        if match:
+            if not _swap_date_window(query.get("pipeline") if aggregate else query.get("query", {}), window):
+                return None
+            consumed.append(match.span())
+            edited = True
+            break
+
+    new_sort = new_limit = None
+    ranked = False
+    sort = _SORT_PATTERN.search(text)
+    if sort:
+        consumed.append(sort.span())
+        field = _resolve_field(collection, sort.group(1))
+        # After a $group/$project the schema fields no longer exist, so the sort needs a fresh generation
+        reshaped = aggregate and any("$group" in stage or "$project" in stage for stage in query["pipeline"])
+        if field is None or reshaped:
+            return None
+        new_sort = {field: 1 if sort.group(2) in ("asc", "ascending", "lowest") else -1}
+
+    limit = _LIMIT_PATTERN.search(text)
+    if limit:
+        consumed.append(limit.span())
+        new_limit = int(limit.group(1))
+        ranked = "top" in limit.group(0)
+
+    if new_sort is not None or new_limit is not None:
+        if aggregate:
+            if not _set_ranking(query["pipeline"], new_sort, new_limit, ranked):
+                return None
+        else:
+            if ranked and new_sort is None and "sort" not in query:
+                return None
+            if new_sort is not None:
+                query["sort"] = new_sort
+            if new_limit is not None:
+                query["limit"] = new_limit
+        edited = True
+
+    enum_fields = SCHEMA_ENUMS.get(collection, {})
+    for match in re.finditer(r"\b(?:only|just) (\w+)", text):
+        if match.group(1) in enum_fields:
+            consumed.append(match.span(1))
+            field, value = enum_fields[match.group(1)]
+            if aggregate:
+                _set_leading_match(query["pipeline"], field, value)
+            else:
+                query.setdefault("query", {})[field] = value
+            edited = True
+
+    # Only take the fast path when every word is part of a recognised edit or filler
+    leftover = text
+    for start, end in consumed:
+        leftover = leftover[:start] + " " * (end - start) + leftover[end:]
+    if any(word not in _FILLER_WORDS for word in re.findall(r"\w+", leftover)):
+        return None
+
+    return query if edited else None
+
+
+def refine_last_query(question: str) -> Optional[dict]:
+    """Fast path for follow-ups: the edited previous query for this session, or None to generate from scratch."""
+    if not FOLLOWUP_FAST_PATH_ENABLED:
+        return None
+    previous = get_last_query()
+    if previous is None:
+        return None
+    refined = apply_refinement(question, previous)
+    if refined is not None:
+        print(f"Follow-up fast path: '{question}' applied as an edit to the previous query")
+    return refined
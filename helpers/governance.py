@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReadPreference
+
+
+# --- Per-query budgets ---
+MAX_DOCS_EXAMINED = int(os.getenv("QUERY_MAX_DOCS_EXAMINED", "200000"))
+MAX_QUERY_TIME_MS = int(os.getenv("QUERY_MAX_TIME_MS", "10000"))
+MAX_RESULT_DOCS = int(os.getenv("QUERY_MAX_RESULT_DOCS", "5000"))
+QUERY_ALLOW_DISK_USE = os.getenv("QUERY_ALLOW_DISK_USE", "false").lower() == "true"
+# "reject" refuses over-budget queries, "narrow" adds a $limit where that bounds the scan and rejects otherwise
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "narrow")
+# "explain" asks the query planner, "stats" only uses cached collection counts, "off" skips the check
+QUERY_COST_CHECK = os.getenv("QUERY_COST_CHECK", "explain")
+QUERY_READ_PREFERENCE = ReadPreference.SECONDARY_PREFERRED if os.getenv("QUERY_READ_SECONDARY", "true").lower() == "true" else ReadPreference.PRIMARY
+
+COLLECTION_STATS_TTL_S = int(os.getenv("COLLECTION_STATS_TTL_S", "300"))
+# Rough share of a collection an index scan is assumed to touch when the planner picks an index
+INDEXED_SCAN_FRACTION = float(os.getenv("INDEXED_SCAN_FRACTION", "0.1"))
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+_collection_counts: Dict[str, Tuple[float, int]] = {}
+_collection_counts_lock = threading.Lock()
+
+
+def get_collection_count(db, name: str) -> int:
+    """Returns the (cached) estimated document count of a collection."""
+    now = time.monotonic()
+    with _collection_counts_lock:
+        cached = _collection_counts.get(name)
+        if cached is not None and now - cached[0] < COLLECTION_STATS_TTL_S:
+            return cached[1]
+    count = db[name].estimated_document_count()
+    with _collection_counts_lock:
+        _collection_counts[name] = (now, count)
+    return count
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if isinstance(plan.get("stage"), str) else []
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _plan_stages(item)]
+    return []
+
+
+def _uses_collection_scan(db, final_query: dict, max_time_ms: int) -> bool:
+    name = final_query["collection"]
+    if QUERY_COST_CHECK == "explain":
+        if final_query["operation"] == "aggregate":
+            command = {"aggregate": name, "pipeline": final_query["pipeline"], "cursor": {}}
+        else:
+            command = {"find": name, "filter": final_query.get("query", {})}
+        try:
+            explain = db.command("explain", command, verbosity="queryPlanner", maxTimeMS=max_time_ms)
+            return "COLLSCAN" in _plan_stages(explain)
+        except Exception as e:
+            print(f"Warning: explain failed, falling back to collection stats: {e}")
+    # Without a plan, only an unfiltered query is known to scan everything
+    if final_query["operation"] == "aggregate":
+        first_stage = final_query["pipeline"][0] if final_query["pipeline"] else {}
+        return "$match" not in first_stage
+    return not final_query.get("query")
+
+
+def estimate_docs_examined(db, final_query: dict, max_time_ms: int) -> Tuple[int, Optional[int], bool]:
+    """
+    Estimates documents examined by a query. Returns the estimate, for aggregations the index of the
+    first $lookup stage whose input could be capped with a $limit to narrow the query, and whether the
+    planner chose a collection scan.
+    """
+    count = get_collection_count(db, final_query["collection"])
+    collscan = _uses_collection_scan(db, final_query, max_time_ms)
+    rows = count if collscan else int(count * INDEXED_SCAN_FRACTION)
+    examined = rows
+
+    if final_query["operation"] == "find":
+        # A limit only stops an unfiltered scan early; with a filter the scan may still read every document
+        if collscan and not final_query.get("query") and final_query.get("limit") and "sort" not in final_query:
+            examined = min(examined, int(final_query["limit"]))
+        return examined, None, collscan
+
+    narrow_at = None
+    for index, stage in enumerate(final_query["pipeline"]):
+        if "$limit" in stage:
+            rows = min(rows, int(stage["$limit"]))
+        elif "$group" in stage and narrow_at is None:
+            narrow_at = -1  # a $limit after grouping would change the answer, not the scan
+        elif "$lookup" in stage:
+            lookup = stage["$lookup"]
+            foreign_count = get_collection_count(db, lookup["from"])
+            # Joins on _id use the default index; anything else is assumed to scan the foreign collection per row
+            per_row = 1 if lookup.get("foreignField") == "_id" else foreign_count
+            examined += rows * per_row
+            if narrow_at is None:
+                narrow_at = index
+    return examined, (narrow_at if narrow_at is not None and narrow_at >= 0 else None), collscan
+
+
+# Stages whose output depends on every input row, so capping rows before them changes the answer
+_REDUCING_STAGES = ("$group", "$count", "$bucket", "$bucketAuto", "$facet", "$sortByCount")
+# Stages that emit exactly one document per input document, so the row count still shows whether a cap was hit
+_ROW_PRESERVING_STAGES = ("$lookup", "$project", "$addFields", "$set", "$unset", "$sort", "$replaceRoot", "$replaceWith")
+
+
+class QueryResult(list):
+    """Query rows plus notes (narrowing, truncation) that the agent must see alongside them."""
+
+    def __init__(self, rows, notes: Optional[List[str]] = None):
+        super().__init__(rows)
+        self.notes = list(notes or [])
+
+
+def enforce_query_budget(db, final_query: dict, max_time_ms: int,
+                         allow_narrowing: bool = True) -> Tuple[dict, Optional[Dict[str, Any]]]:
+    """
+    Checks a parsed query against the per-query budgets before it runs. Returns the query, possibly
+    narrowed with a $limit, and a description of the narrowing (None if the query was not narrowed), or
+    raises QueryBudgetExceeded with a message the agent can act on. Narrowing is only used where the
+    $limit actually bounds the scan; pass the description and the rows to narrowing_note afterwards.
+    """
+    if QUERY_COST_CHECK == "off":
+        return final_query, None
+
+    examined, narrow_at, collscan = estimate_docs_examined(db, final_query, max_time_ms)
+    if examined <= MAX_DOCS_EXAMINED:
+        return final_query, None
+
+    if allow_narrowing and QUERY_BUDGET_MODE == "narrow":
+        name = final_query["collection"]
+        # A filtered collection scan keeps reading until it finds enough matches, so a $limit does not bound it
+        if final_query["operation"] == "find" and "sort" not in final_query and not (collscan and final_query.get("query")):
+            row_cap = min(int(final_query.get("limit") or MAX_RESULT_DOCS), MAX_RESULT_DOCS)
+            print(f"Narrowing find on {name}: ~{examined} documents examined")
+            return {**final_query, "limit": row_cap}, {
+                "row_cap": row_cap,
+                "exact_count": True,
+                "note": f"Query narrowed: it would have examined ~{examined} documents (limit {MAX_DOCS_EXAMINED}), so only "
+                        f"the first {row_cap} matching '{name}' documents were returned. This is a partial result."
+            }
+        pipeline = final_query.get("pipeline", [])
+        reduces = any(stage_name in stage for stage in pipeline for stage_name in _REDUCING_STAGES)
+        filtered_scan = collscan and any("$match" in stage for stage in pipeline[:narrow_at or 0]) \
+            and get_collection_count(db, name) > MAX_DOCS_EXAMINED
+        if narrow_at is not None and not reduces and not filtered_scan:
+            lookup = pipeline[narrow_at]["$lookup"]
+            foreign_count = max(get_collection_count(db, lookup["from"]), 1)
+            row_cap = max(1, MAX_DOCS_EXAMINED // foreign_count)
+            print(f"Narrowing aggregate on {name}: $limit {row_cap} before $lookup")
+            return {**final_query, "pipeline": pipeline[:narrow_at] + [{"$limit": row_cap}] + pipeline[narrow_at:]}, {
+                "row_cap": row_cap,
+                # Only then does a short result prove the $limit was not reached
+                "exact_count": all(any(key in stage for key in _ROW_PRESERVING_STAGES) for stage in pipeline[narrow_at:]),
+                "note": f"Query narrowed: it would have examined ~{examined} documents (limit {MAX_DOCS_EXAMINED}), so only "
+                        f"the first {row_cap} '{name}' documents were joined with '{lookup['from']}'. This is a partial result."
+            }
+
+    raise QueryBudgetExceeded(
+        f"estimated ~{examined} documents examined on '{final_query['collection']}', over the limit of {MAX_DOCS_EXAMINED}. "
+        f"Add a date filter (e.g. created_at within the last 7 days), filter before any $lookup, "
+        f"or use a summary collection (SalesSummary, ExpenseSummary) instead."
+    )
+
+
+def narrowing_note(narrowing: Optional[Dict[str, Any]], rows: list) -> Optional[str]:
+    """The narrowing note, unless fewer rows than the cap came back and so the result is complete."""
+    if narrowing is None or (narrowing["exact_count"] and len(rows) < narrowing["row_cap"]):
+        return None
+    return narrowing["note"]
+
+
+def cap_result_size(final_query: dict) -> Tuple[dict, bool]:
+    """Bounds the number of documents a query may return. Also returns whether the cap is tighter than the query's own limit."""
+    if final_query["operation"] == "find":
+        own_limit = int(final_query.get("limit") or 0)
+        return {**final_query, "limit": min(own_limit or MAX_RESULT_DOCS, MAX_RESULT_DOCS)}, not own_limit or own_limit > MAX_RESULT_DOCS
+    pipeline = final_query["pipeline"]
+    if pipeline and "$limit" in pipeline[-1] and int(pipeline[-1]["$limit"]) <= MAX_RESULT_DOCS:
+        return final_query, False
+    return {**final_query, "pipeline": pipeline + [{"$limit": MAX_RESULT_DOCS}]}, True
+
+
+def truncation_note(capped: bool, rows: list) -> Optional[str]:
+    if not capped or len(rows) < MAX_RESULT_DOCS:
+        return None
+    return (
+        f"Result truncated at {MAX_RESULT_DOCS} rows (QUERY_MAX_RESULT_DOCS); more documents matched, so totals or "
+        f"rankings computed from these rows are partial. Aggregate in the query or narrow the date range for a complete answer."
+    )
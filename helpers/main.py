@@ -21,11 +21,11 @@ def get_yesterday_start_utc(): return get_iso_datetime((datetime.datetime.now(da
 def get_current_utc_now(): return get_iso_datetime(datetime.datetime.now(datetime.timezone.utc))
 def get_last_month_start_utc():
     now = datetime.datetime.now(datetime.timezone.utc)
-    first_day = now.replace(day=1, hour=0, minute=0, second=0)
+    first_day = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     return get_iso_datetime(first_day - relativedelta(months=1))
 def get_last_month_end_utc():
     now = datetime.datetime.now(datetime.timezone.utc)
-    first_day = now.replace(day=1, hour=0, minute=0, second=0)
+    first_day = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     return get_iso_datetime(first_day - datetime.timedelta(microseconds=1))
 def get_last_7_days_start_utc():
     dt = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)
@@ -0,0 +1,117 @@
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional
+
+
+TIER_ORDER = ["light", "standard", "strong"]
+
+# Minimum tier per stage; the complexity score can only raise it
+STAGE_MIN_TIERS = {
+    "agent": os.getenv("LLM_AGENT_MIN_TIER", "standard"),
+    "generation": os.getenv("LLM_GENERATION_MIN_TIER", "light"),
+    "planner": os.getenv("LLM_PLANNER_MIN_TIER", "standard"),
+}
+# Price per million tokens, used for rough per-tier cost metrics (tokens approximated as characters / 4)
+TIER_PRICE_PER_MTOK = {
+    "light": float(os.getenv("LLM_LIGHT_PRICE_PER_MTOK", "0.075")),
+    "standard": float(os.getenv("LLM_STANDARD_PRICE_PER_MTOK", "0.10")),
+    "strong": float(os.getenv("LLM_STRONG_PRICE_PER_MTOK", "0.30")),
+}
+STANDARD_TIER_SCORE = int(os.getenv("LLM_STANDARD_TIER_SCORE", "2"))
+STRONG_TIER_SCORE = int(os.getenv("LLM_STRONG_TIER_SCORE", "5"))
+
+# Words in a question that point at a collection (or a family of related collections)
+_COLLECTION_PATTERNS = {
+    "sales": r"\bsales?\b|\bsold\b|\bselling\b",
+    "expenses": r"\bexpenses?\b|\bspent\b|\bspending\b",
+    "services": r"\bservices?\b",
+    "inventory": r"\binventory\b|\bstock\b|\bproducts?\b|\bitems?\b",
+    "category": r"\bcategor(?:y|ies)\b",
+    "accounts": r"\baccounts?\b|\bbalance\b|\bcash\b|\bequity\b|\bassets?\b|\brevenue\b|\bwrite[- ]?offs?\b|\bcredit(?:ed)?\b",
+}
+_AGGREGATION_PATTERN = re.compile(
+    r"\b(?:compare|comparison|versus|vs|join|group(?:ed)?|per|each|average|avg|mean|total|sum|trend|breakdown|"
+    r"rank|top|highest|lowest|most|least|ratio|margin|profit|growth|between|over time)\b"
+)
+
+
+def score_question(question: str, history_length: int = 0) -> int:
+    """Complexity score: collections referenced, join/aggregation keywords and conversation length."""
+    text = question.lower()
+    collections = sum(1 for pattern in _COLLECTION_PATTERNS.values() if re.search(pattern, text))
+    aggregation_terms = len(_AGGREGATION_PATTERN.findall(text))
+    score = max(collections - 1, 0) * 2 + min(aggregation_terms, 3)
+    if history_length > 6:
+        score += 1
+    if len(text.split()) > 30:
+        score += 1
+    return score
+
+
+class ModelRouter:
+    """
+    Picks a model tier per stage from the question's complexity and escalates to the next tier when the
+    output fails validation. Models are injected, so fake chat models can be used to test it offline.
+    """
+
+    def __init__(self, models: Dict[str, Any], stage_min_tiers: Optional[Dict[str, str]] = None):
+        self.models = models
+        self.tiers = [tier for tier in TIER_ORDER if tier in models]
+        self.stage_min_tiers = stage_min_tiers if stage_min_tiers is not None else STAGE_MIN_TIERS
+        self._lock = threading.Lock()
+        self._metrics = defaultdict(lambda: {"calls": 0, "latency_s": 0.0, "cost_usd": 0.0, "escalations": 0})
+
+    def tier_for(self, stage: str, question: str, history_length: int = 0) -> str:
+        score = score_question(question, history_length)
+        scored = "strong" if score >= STRONG_TIER_SCORE else "standard" if score >= STANDARD_TIER_SCORE else "light"
+        wanted = max(TIER_ORDER.index(scored), TIER_ORDER.index(self.stage_min_tiers.get(stage, "light")))
+        # Fall back to the nearest configured tier at or above the wanted one
+        for tier in self.tiers:
+            if TIER_ORDER.index(tier) >= wanted:
+                return tier
+        return self.tiers[-1]
+
+    def model_for(self, stage: str, question: str, history_length: int = 0) -> Any:
+        return self.models[self.tier_for(stage, question, history_length)]
+
+    def invoke(self, stage: str, question: str, call: Callable[[Any], str], validate: Callable[[str], bool],
+               history_length: int = 0, prompt_chars: int = 0) -> str:
+        """
+        Runs `call` with the routed model. If `validate` rejects the output, the call is retried on the
+        next tier up; the last tier's output is returned as-is.
+        """
+        tier = self.tier_for(stage, question, history_length)
+        while True:
+            start = time.monotonic()
+            result = call(self.models[tier])
+            self.record(stage, tier, time.monotonic() - start, prompt_chars + len(result or ""))
+            next_index = self.tiers.index(tier) + 1
+            if validate(result) or next_index >= len(self.tiers):
+                return result
+            print(f"Escalating {stage} from '{tier}' to '{self.tiers[next_index]}' after failed validation")
+            with self._lock:
+                self._metrics[f"{stage}/{tier}"]["escalations"] += 1
+            tier = self.tiers[next_index]
+
+    def record(self, stage: str, tier: str, latency_s: float, chars: int = 0) -> None:
+        """Records one call; also used for whole agent runs, which go through the routed model directly."""
+        with self._lock:
+            metrics = self._metrics[f"{stage}/{tier}"]
+            metrics["calls"] += 1
+            metrics["latency_s"] += latency_s
+            metrics["cost_usd"] += chars / 4 / 1_000_000 * TIER_PRICE_PER_MTOK.get(tier, 0.0)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                key: {
+                    "calls": metrics["calls"],
+                    "avg_latency_s": round(metrics["latency_s"] / metrics["calls"], 3) if metrics["calls"] else 0.0,
+                    "cost_usd": round(metrics["cost_usd"], 6),
+                    "escalation_rate": round(metrics["escalations"] / metrics["calls"], 3) if metrics["calls"] else 0.0,
+                }
+                for key, metrics in self._metrics.items()
+            }
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.82"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+SEMANTIC_CACHE_DIMENSIONS = int(os.getenv("SEMANTIC_CACHE_DIMENSIONS", "4096"))
+NGRAM_SIZES = (3, 4, 5)
+
+_MONTHS = r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+_DATE_TERM_PATTERN = re.compile(
+    rf"\b(?:today|tonight|yesterday|now|latest|recent|(?:this|last|past|previous|next)\s+(?:\d+\s+)?(?:day|week|month|year)s?|{_MONTHS})\b"
+)
+_NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Domain phrasings that mean the same thing but share few characters, mapped to one canonical form before embedding
+_CANONICAL_PHRASES = [
+    (re.compile(r"\b(?:running|run|getting) low\b|\bbelow (?:the |their )?(?:threshold|minimum)\b|\blow (?:on )?stock\b"), "low stock"),
+    (re.compile(r"\bproducts?\b|\bitems?\b|\bgoods\b"), "items"),
+    (re.compile(r"\b(?:which|what|list|show(?: me)?|give me|get)\b"), " "),
+]
+
+# Words that flip or bound a question's meaning while barely changing its characters
+_QUALIFIERS = [
+    (re.compile(r"\b(?:not|no|non|never|without|except|excluding)\b|n t\b"), "not"),
+    (re.compile(r"\b(?:asc|ascending|increasing|lowest|least|smallest|cheapest|oldest|earliest)\b"), "asc"),
+    (re.compile(r"\b(?:desc|descending|decreasing|highest|most|largest|biggest|priciest|newest|latest)\b"), "desc"),
+    (re.compile(r"\b(?:above|over|more than|greater|exceeding|higher than|at least)\b"), "gt"),
+    (re.compile(r"\b(?:below|under|less than|fewer|lower than|at most)\b"), "lt"),
+    (re.compile(r"\btop\b"), "top"),
+    (re.compile(r"\bbottom\b"), "bottom"),
+]
+
+# (date expressions, numbers in order, qualifier labels)
+Constraints = Tuple[FrozenSet[str], Tuple[str, ...], FrozenSet[str]]
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s.,-]", " ", question.lower())).strip()
+
+
+def canonicalize(question: str) -> str:
+    text = normalize_question(question)
+    for pattern, replacement in _CANONICAL_PHRASES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def extract_constraints(question: str) -> Constraints:
+    """
+    Date expressions, numbers (in order) and negation/direction/comparator words in a question; two questions
+    only share a query if these match exactly. Qualifiers are read after canonicalisation, so "below threshold"
+    counts as "low stock" rather than as a comparator.
+    """
+    text = normalize_question(question)
+    dates = frozenset(re.sub(r"\s+", " ", match) for match in _DATE_TERM_PATTERN.findall(text))
+    numbers = tuple(_NUMBER_PATTERN.findall(text))
+    canonical = canonicalize(question)
+    qualifiers = frozenset(label for pattern, label in _QUALIFIERS if pattern.search(canonical))
+    return dates, numbers, qualifiers
+
+
+def embed(question: str) -> np.ndarray:
+    """Term-frequency vector of hashed character n-grams (word-boundary padded), L2-normalised."""
+    text = canonicalize(question)
+    vector = np.zeros(SEMANTIC_CACHE_DIMENSIONS, dtype=np.float32)
+    for word in text.split():
+        padded = f" {word} "
+        for size in NGRAM_SIZES:
+            for start in range(max(1, len(padded) - size + 1)):
+                gram = padded[start:start + size]
+                vector[zlib.crc32(gram.encode("utf-8")) % SEMANTIC_CACHE_DIMENSIONS] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticQueryCache:
+    """
+    Nearest-neighbour cache of question -> generated PyMongo query. Vectors are weighted by IDF computed
+    over the cached questions, so shared boilerplate ("show me", "items") counts less than domain words.
+    """
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, Constraints, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _idf(self, vectors: List[np.ndarray]) -> np.ndarray:
+        document_frequency = np.count_nonzero(np.vstack(vectors), axis=0)
+        return np.log((1 + len(vectors)) / (1 + document_frequency)) + 1.0
+
+    def lookup(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        constraints = extract_constraints(question)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][2]
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            keys = list(self._entries)
+            vectors = [self._entries[k][0] for k in keys]
+            probe = embed(question)
+            idf = self._idf(vectors + [probe])
+            matrix = np.vstack(vectors) * idf
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            probe = probe * idf
+            probe /= max(float(np.linalg.norm(probe)), 1e-12)
+            scores = matrix @ probe
+
+            for index in np.argsort(scores)[::-1]:
+                if scores[index] < self.threshold:
+                    break
+                _, cached_constraints, query = self._entries[keys[index]]
+                if cached_constraints == constraints:
+                    self._entries.move_to_end(keys[index])
+                    self.hits += 1
+                    print(f"Semantic cache hit ({scores[index]:.2f}): '{question}' ~ '{keys[index]}'")
+                    return query
+            self.misses += 1
+            return None
+
+    def store(self, question: str, query: str) -> None:
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = (embed(question), extract_constraints(question), query)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+semantic_query_cache = SemanticQueryCache()
@@ -0,0 +1,118 @@
+import contextvars
+import functools
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "6"))
+# A tool called this many times with the same (normalised) input in one run is treated as a loop
+TOOL_LOOP_THRESHOLD = int(os.getenv("TOOL_LOOP_THRESHOLD", "3"))
+# Error outputs that may succeed on retry; they are not memoized, so a retry really runs (rejections are deterministic and stay memoized)
+TRANSIENT_ERROR_PREFIXES = ("Query timed out", "Query generation timed out", "An error occurred", "JSON decoding error")
+
+
+class ToolLoopDetected(Exception):
+    def __init__(self, tool_name: str, tool_input: str, output: Any):
+        super().__init__(f"Agent repeated {tool_name}({tool_input!r}) {TOOL_LOOP_THRESHOLD} times")
+        self.tool_name = tool_name
+        self.tool_input = tool_input
+        self.output = output
+
+
+class RunMemo:
+    """Tool input -> output memo for a single agent run."""
+
+    def __init__(self):
+        self.outputs: Dict[Tuple[str, str], Any] = {}
+        self.counts: Counter = Counter()
+        self.avoided_calls = 0
+        self.lock = threading.Lock()
+
+
+# Totals across runs, for the metrics endpoint
+tool_call_stats = {"runs": 0, "avoided_calls": 0, "loops_detected": 0}
+_tool_call_stats_lock = threading.Lock()
+
+_current_memo: contextvars.ContextVar = contextvars.ContextVar("current_run_memo", default=None)
+
+
+def start_run_memo() -> contextvars.Token:
+    with _tool_call_stats_lock:
+        tool_call_stats["runs"] += 1
+    return _current_memo.set(RunMemo())
+
+
+def reset_run_memo(token: contextvars.Token) -> None:
+    _current_memo.reset(token)
+
+
+def current_run_memo() -> Optional[RunMemo]:
+    return _current_memo.get()
+
+
+def normalize_tool_input(tool_input: str) -> str:
+    """Lowercases and strips quotes, punctuation and extra whitespace, so trivially different inputs share a key."""
+    text = re.sub(r"[\"'`.,;:!?]", " ", str(tool_input).lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _is_transient_error(output: Any) -> bool:
+    """True for a transient error message, or a compound result (label -> output) containing one."""
+    if isinstance(output, str):
+        return output.startswith(TRANSIENT_ERROR_PREFIXES)
+    if isinstance(output, dict):
+        return any(isinstance(value, str) and value.startswith(TRANSIENT_ERROR_PREFIXES) for value in output.values())
+    return False
+
+
+def memoized_tool(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wraps a single-input tool function so repeated calls within one agent run return the first output.
+    Raises ToolLoopDetected once the same call has been repeated TOOL_LOOP_THRESHOLD times.
+    Transient errors are not memoized and do not count towards the threshold; AGENT_MAX_ITERATIONS still bounds retries.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        memo = _current_memo.get()
+        if memo is None:
+            return func(*args, **kwargs)
+
+        # LangChain passes the single tool input by keyword
+        tool_input = args[0] if args else next(iter(kwargs.values()), "")
+
+        key = (func.__name__, normalize_tool_input(tool_input))
+        with memo.lock:
+            if key in memo.outputs:
+                memo.counts[key] += 1
+                memo.avoided_calls += 1
+                with _tool_call_stats_lock:
+                    tool_call_stats["avoided_calls"] += 1
+                if memo.counts[key] >= TOOL_LOOP_THRESHOLD:
+                    with _tool_call_stats_lock:
+                        tool_call_stats["loops_detected"] += 1
+                    raise ToolLoopDetected(func.__name__, tool_input, memo.outputs[key])
+                print(f"Memoized {func.__name__} call reused within this run")
+                return memo.outputs[key]
+
+        output = func(*args, **kwargs)
+        if _is_transient_error(output):
+            return output
+        with memo.lock:
+            memo.outputs[key] = output
+            memo.counts[key] += 1
+        return output
+
+    return wrapper
+
+
+def final_answer_from_observation(llm: Any, question: str, observation: Any) -> str:
+    """Turns the repeated tool output into a final answer with one direct LLM call, ending a looping run."""
+    response = llm.invoke(
+        "Answer the user's question using only the data below. Be concise.\n\n"
+        f"Question: {question}\n\nData: {str(observation)[:8000]}\n\nAnswer:"
+    )
+    return getattr(response, "content", str(response))
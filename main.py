@@ -7,7 +7,7 @@ from langchain.chat_models import init_chat_model
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.responses import PlainTextResponse
 
-from agent_model import model
+from agent_model import model_router
 from prompt.prompt import LLM_PROMPT_TEMPLATE_ESCAPED, PRISMA_SCHEMA_FOR_LLM, PYMONGO_OUTPUT_FORMAT_INSTRUCTIONS, \
     FEW_SHOT_EXAMPLES
 from pydantic import BaseModel
@@ -17,13 +17,23 @@ from langchain.prompts import PromptTemplate
 from langchain.agents import initialize_agent, AgentType, load_tools
 from langchain.memory import ConversationBufferMemory
 
-from tools.main import natural_language_query_executor
+from helpers.cache_warmer import CACHE_WARMER_ENABLED, run_cache_warmer
+from helpers.deadline import current_deadline, reset_deadline, stage_budget, start_deadline
+from helpers.followup import reset_session, set_session
+from helpers.tool_memo import AGENT_MAX_ITERATIONS, ToolLoopDetected, final_answer_from_observation, current_run_memo, \
+    reset_run_memo, start_run_memo, tool_call_stats
+from helpers.export import EXPORT_BATCH_SIZE, EXPORT_MAX_TIME_MS, EXPORT_MEDIA_TYPES, EXPORT_STREAMERS
+from helpers.governance import QueryBudgetExceeded
+from tools.main import natural_language_query_executor, compound_query_executor, analyze_dataset, open_export_cursor, \
+    execute_pymongo_query, get_mongo_client
 from fastapi import FastAPI
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from starlette.middleware.cors import CORSMiddleware
 from typing import AsyncGenerator
 import asyncio
+import time
+from contextlib import asynccontextmanager
 
 load_dotenv()
 
@@ -32,10 +42,12 @@ load_dotenv()
 user_memory_store = {}
 tools = [
     natural_language_query_executor,  # The main tool for DB interaction
+    compound_query_executor,  # Planner mode for multi-part questions
+    analyze_dataset,  # Local analytics over large query results
 ]
 
 
-def get_agent_for_user(user_id):
+def get_agent_for_user(user_id, question=""):
     if user_id not in user_memory_store:
         user_memory_store[user_id] = ConversationBufferMemory(
             memory_key="chat_history",
@@ -45,13 +57,17 @@ def get_agent_for_user(user_id):
 
 
     memory = user_memory_store[user_id]
+    tier = model_router.tier_for("agent", question, len(memory.chat_memory.messages))
 
     return initialize_agent(
         tools=tools,
-        llm=model,
+        llm=model_router.models[tier],
         agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
         memory=memory,
-        verbose=False
+        verbose=False,
+        max_iterations=AGENT_MAX_ITERATIONS,
+        max_execution_time=stage_budget("agent"),
+        metadata={"model_tier": tier}
     )
 
 
@@ -59,7 +75,18 @@ def get_agent_for_user(user_id):
 
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fails startup when MONGODB_URI is missing instead of on the first query (the client connects lazily)
+    get_mongo_client()
+    # Re-runs the hottest queries shortly after each date-window rollover (midnight UTC, month start)
+    warmer = asyncio.create_task(run_cache_warmer(execute_pymongo_query)) if CACHE_WARMER_ENABLED else None
+    yield
+    if warmer is not None:
+        warmer.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -78,6 +105,11 @@ class AgentResponse(BaseModel):
     status: str
     result: str
 
+class ExportModel(BaseModel):
+    query: str
+    kinde_id:str
+    format: str = "csv"
+
 
 
 
@@ -85,19 +117,101 @@ import traceback
 
 @app.post("/ask", response_model=AgentResponse)
 async def get_answer_from_prompt(prompt: AgentModel):
+    deadline_token = start_deadline()
+    session_token = set_session(prompt.kinde_id)
+    memo_token = start_run_memo()
     try:
-        agent = get_agent_for_user(prompt.kinde_id)
-        result = agent.invoke({"input": prompt.query})
+        agent = get_agent_for_user(prompt.kinde_id, prompt.query)
+        agent_started = time.monotonic()
+        # Run the blocking agent in a worker thread so the deadline can be enforced from here;
+        # the thread inherits the deadline context, which bounds the LLM and Mongo calls inside it.
+        result = await asyncio.wait_for(
+            asyncio.to_thread(agent.invoke, {"input": prompt.query}),
+            timeout=current_deadline().remaining()
+        )
         output = result.get('output', '')
+        model_router.record("agent", agent.metadata["model_tier"], time.monotonic() - agent_started, len(prompt.query) + len(output))
+
+        return PlainTextResponse(content=output, headers={"X-Avoided-Tool-Calls": str(current_run_memo().avoided_calls)})
+
+    except ToolLoopDetected as loop:
+        # The agent kept repeating the same action; answer from the result it already has
+        print(f"Loop detected: {loop}")
+        try:
+            output = await asyncio.wait_for(
+                asyncio.to_thread(final_answer_from_observation, model_router.models[agent.metadata["model_tier"]], prompt.query, loop.output),
+                timeout=current_deadline().remaining()
+            )
+        except Exception:
+            traceback.print_exc()
+            output = str(loop.output)
+        return PlainTextResponse(content=output, headers={"X-Avoided-Tool-Calls": str(current_run_memo().avoided_calls)})
+    except asyncio.TimeoutError:
+        return {
+            "status": "error",
+            "result": f"Request timed out after {current_deadline().timeout_s:.0f}s"
+        }
+    except Exception as e:
+        traceback.print_exc()
+        return {
+            "status": "error",
+            "result": f"Exception occurred: {str(e)}"
+        }
+    finally:
+        reset_run_memo(memo_token)
+        reset_session(session_token)
+        reset_deadline(deadline_token)
+
+
+@app.get("/metrics/models")
+async def get_model_metrics():
+    return model_router.metrics()
 
-        return PlainTextResponse(content=output)
 
+@app.get("/metrics/tools")
+async def get_tool_metrics():
+    return tool_call_stats
+
+
+@app.post("/export")
+async def export_query_results(request: ExportModel):
+    if request.format not in EXPORT_STREAMERS:
+        return {
+            "status": "error",
+            "result": f"Unsupported export format '{request.format}'. Use one of: {', '.join(EXPORT_STREAMERS)}"
+        }
+
+    deadline_token = start_deadline()
+    try:
+        # Only query generation goes through the LLM; the cursor is streamed straight to the client
+        cursor = await asyncio.wait_for(
+            asyncio.to_thread(open_export_cursor, request.query, EXPORT_BATCH_SIZE, EXPORT_MAX_TIME_MS),
+            timeout=current_deadline().remaining()
+        )
+    except asyncio.TimeoutError:
+        return {
+            "status": "error",
+            "result": f"Export query generation timed out after {current_deadline().timeout_s:.0f}s"
+        }
+    except QueryBudgetExceeded as e:
+        return {
+            "status": "error",
+            "result": f"Query rejected: {str(e)}"
+        }
     except Exception as e:
         traceback.print_exc()
         return {
             "status": "error",
             "result": f"Exception occurred: {str(e)}"
         }
+    finally:
+        reset_deadline(deadline_token)
+
+    return StreamingResponse(
+        EXPORT_STREAMERS[request.format](cursor),
+        media_type=EXPORT_MEDIA_TYPES[request.format],
+        headers={"Content-Disposition": f'attachment; filename="export.{request.format}"'}
+    )
 
 # @app.post("/ask")
 # async def get_answer_from_prompt(prompt: AgentModel):
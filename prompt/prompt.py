@@ -515,3 +515,50 @@ User Query: {{user_query}}
 
 PyMongo Query (Only valid JSON or the JSON error object, nothing else):
 """
+
+
+# Date placeholder rules for the planner prompt. Braces are doubled once for PromptTemplate, so the model sees {{today_start}}
+DECOMPOSITION_DATE_PLACEHOLDER_RULES = """
+# Only use these allowed placeholders for dates:
+# {{yesterday_start}}, {{today_start}}, {{last_month_start}}, {{last_month_end}}, {{last_7_days_start}}, {{now}}
+# For specific dates like "June 6th, 2025", convert the date to ISO format and use:
+# {{YYYY-MM-DD_start}} and {{YYYY-MM-DD_end}}
+# 🚫 Do NOT create custom placeholders. These will cause failures.
+# ✅ Always use the full ISO format (YYYY-MM-DD). Do NOT generate or invent placeholder formats.
+""".replace("{{", "{{{{").replace("}}", "}}}}")
+
+
+DECOMPOSITION_PROMPT_TEMPLATE = f"""
+{{PRISMA_SCHEMA_FOR_LLM}}
+
+{{PYMONGO_OUTPUT_FORMAT_INSTRUCTIONS}}
+
+{{FEW_SHOT_EXAMPLES}}
+{DECOMPOSITION_DATE_PLACEHOLDER_RULES}
+# ⚠️ CRITICAL INSTRUCTIONS FOR COMPOUND QUESTIONS:
+# The user query below may ask for several independent things at once (e.g. "compare this month's sales, expenses and services revenue").
+# Step 1: Split the query into the smallest set of independent sub-questions that can each be answered by ONE PyMongo query.
+# Step 2: Write one PyMongo query per sub-question, following exactly the output format above and using only the allowed date placeholders.
+# Step 3: Do NOT join unrelated collections with $lookup just to answer everything in one query; prefer separate sub-queries.
+# Step 4: Respond ONLY with a JSON object in this format (no extra text or explanation):
+
+# {{{{
+#   "subqueries": [
+#     {{{{"label": "<short snake_case name for this part>", "query": <PyMongo JSON query>}}}}
+#   ]
+# }}}}
+
+# If the query is NOT related to the business domain or schema, respond with ONLY the following JSON error object format:
+
+# {{{{
+#   "error": "The query is not related to the available schema. I am only able to assist with questions related to the business domain and schema below.",
+#   "available_schema": "<INSERT CURRENTLY AVAILABLE SUMMARY OF THE TABLES IN THE SCHEMA HERE>"
+# }}}}
+
+# The schema must be included in the "available_schema" field as a string.
+
+Now, decompose the following natural language query into independent executable PyMongo Queries.
+User Query: {{user_query}}
+
+Sub-queries (Only valid JSON or the JSON error object, nothing else):
+"""